@@ -1,34 +1,51 @@
 #!/usr/bin/env python3
 
 import signalflow as sf
-import time
-import threading
-import random
+import heapq
 import numpy as np
-from scipy.io import wavfile
+import soundfile
+
+# Offline render settings: sample rate and the block size the graph renders in
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 512
+
+# Level trims for the LFO-panned layers. StereoPanner is constant-power, while
+# the original two-speaker layout faded each side linearly to silence at the
+# centre (average power x^2), so these restore each layer's average level:
+# sqrt(1/2) for full sweeps, sqrt(0.48^2 / 2) for the drones' +/-0.48 sweep
+FULL_SWEEP_PAN_LEVEL = 0.707
+DRONE_PAN_LEVEL = 0.34
+
+def stereo_position(signal, x):
+    # Place a mono signal at a fixed x between speakers at -1 and +1. Each speaker's
+    # gain falls off linearly with distance, reaching 0 at the centre (x = 0 is silent);
+    # the gains are plain numbers, so this is a single multiply node
+    return signal * [max(0.0, -x), max(0.0, x)]
 
 class AmbientSoundscape:
 
     def __init__(self):
-        self.graph = sf.AudioGraph()
-        self.env = sf.SpatialEnvironment()
-        self.setup_speakers()
+        # Dummy output device lets the graph render offline, faster than real time
+        self.graph = sf.AudioGraph(output_device=sf.AudioOut_Dummy(2, SAMPLE_RATE, BLOCK_SIZE), start=False)
         self.layers = []
-        self.running = False
         
-    def setup_speakers(self):
-        # Stereo setup: left and right speakers
-        self.env.add_speaker(0, -1.0, 0.0, 0.0)   # Left
-        self.env.add_speaker(1, 1.0, 0.0, 0.0)    # Right
-    
-    def create_pad_layer(self, base_freq, x_pos, y_pos, detune_amount=0.02):
-        # Create detuned oscillators for richness
-        osc1 = sf.SineOscillator(base_freq)
-        osc2 = sf.SineOscillator(base_freq * (1 + detune_amount))
-        osc3 = sf.SineOscillator(base_freq * (1 - detune_amount))
+        # One period of the bell chord (root, third, fifth, octave at 4:5:6:8),
+        # so each bell needs a single wavetable oscillator instead of four sines
+        phase = np.arange(4096) / 4096
+        bell_chord = (0.8 * np.sin(2 * np.pi * 4 * phase) +
+                      0.6 * np.sin(2 * np.pi * 5 * phase) +
+                      0.5 * np.sin(2 * np.pi * 6 * phase) +
+                      0.3 * np.sin(2 * np.pi * 8 * phase))
+        self.bell_wavetable = sf.Buffer(bell_chord.astype(np.float32))
+        
+    def create_pad_layer(self, base_freq, x_pos, detune_amount=0.02):
+        # Create detuned oscillators for richness - one 3-channel oscillator node
+        oscs = sf.SineOscillator([base_freq,
+                                  base_freq * (1 + detune_amount),
+                                  base_freq * (1 - detune_amount)])
         
-        # Mix oscillators
-        pad = (osc1 + osc2 + osc3) * 0.15
+        # Mix oscillators down to mono
+        pad = sf.ChannelMixer(1, oscs, amplitude_compensation=False) * (0.15 * FULL_SWEEP_PAN_LEVEL)
         
         # Apply very slow filter modulation
         filter_lfo = sf.SineLFO(frequency=0.03, min=base_freq * 0.5, max=base_freq * 4)
@@ -45,12 +62,12 @@ class AmbientSoundscape:
         pan_lfo = sf.SineLFO(frequency=0.05, min=-1.0, max=1.0)  # Faster pan (20 second cycle)
         pan_position = pan_lfo  # Full left-right sweeps
         
-        # Position in space
-        positioned = sf.SpatialPanner(self.env, breathing_pad, x=pan_position, y=y_pos, z=0.0)
+        # Position in the stereo field
+        positioned = sf.StereoPanner(breathing_pad, pan_position)
         
         return positioned
     
-    def create_texture_layer(self, x_pos, y_pos):
+    def create_texture_layer(self, x_pos):
         # Noise-based texture
         noise = sf.WhiteNoise() * 0.08
         
@@ -68,12 +85,12 @@ class AmbientSoundscape:
         # Add reverb
         reverb_textured = sf.CombDelay(textured, delay_time=1.5, feedback=0.85, max_delay_time=4.5)
         
-        # Position in space
-        positioned = sf.SpatialPanner(self.env, reverb_textured, x=x_pos, y=y_pos, z=0.0)
+        # Position in the stereo field
+        positioned = stereo_position(reverb_textured, x_pos)
         
         return positioned
     
-    def create_drone_layer(self, freq, x_pos, y_pos):
+    def create_drone_layer(self, freq, x_pos):
         # Very slow frequency modulation
         freq_mod_lfo = sf.SineLFO(frequency=0.01, min=freq * 0.98, max=freq * 1.02)
         
@@ -85,7 +102,7 @@ class AmbientSoundscape:
         
         # Subtle amplitude envelope
         amp_mod = sf.SineLFO(frequency=0.01, min=0.6, max=1.0)
-        modulated_drone = filtered_drone * amp_mod * 0.2
+        modulated_drone = filtered_drone * amp_mod * (0.2 * DRONE_PAN_LEVEL)
         
         # Add reverb
         reverb_drone = sf.CombDelay(modulated_drone, delay_time=1.6, feedback=0.8, max_delay_time=6.0)
@@ -94,12 +111,12 @@ class AmbientSoundscape:
         drone_pan_lfo = sf.SineLFO(frequency=0.02, min=-0.8, max=0.8)  # Moderate pan (50 second cycle)
         drone_pan_position = drone_pan_lfo * 0.6  # Substantial movement but not full sweep
         
-        # Position in space
-        positioned = sf.SpatialPanner(self.env, reverb_drone, x=drone_pan_position, y=y_pos, z=0.0)
+        # Position in the stereo field
+        positioned = sf.StereoPanner(reverb_drone, drone_pan_position)
         
         return positioned
     
-    def create_bass_layer(self, freq, x_pos, y_pos):
+    def create_bass_layer(self, freq, x_pos):
         # Bass layer - offset frequency to avoid masking
         bass_freq = freq * 0.75  # Between drone and octave below for distinction
         
@@ -120,30 +137,26 @@ class AmbientSoundscape:
         reverb_bass = sf.CombDelay(modulated_bass, delay_time=2.4, feedback=0.85, max_delay_time=8.0)
         
         # Keep bass centered - no panning
-        # Position in space
-        positioned = sf.SpatialPanner(self.env, reverb_bass, x=0.0, y=y_pos, z=0.0)
+        # Position in the stereo field
+        positioned = stereo_position(reverb_bass, 0.0)
         
         return positioned
     
-    def create_bell_layer(self, base_freq, x_pos, y_pos):
+    def create_bell_layer(self, base_freq, x_pos):
         # Add some detuning modulation to base frequency
         detune_lfo = sf.SineLFO(frequency=0.09, min=0.99, max=1.01)
         modulated_freq = base_freq * detune_lfo
         
-        # Chord-like harmonics for warmer, more musical bell sound
-        root = sf.SineOscillator(modulated_freq) * 0.8           # Root note
-        third = sf.SineOscillator(base_freq * 1.25) * 0.6       # Major third
-        fifth = sf.SineOscillator(base_freq * 1.5) * 0.5        # Perfect fifth
-        octave = sf.SineOscillator(base_freq * 2.0) * 0.3       # Octave
-        
-        bell = root + third + fifth + octave
+        # Chord-like harmonics for warmer, more musical bell sound - the table
+        # holds four cycles of the root per period, so play it at a quarter rate
+        bell = sf.Wavetable(self.bell_wavetable, frequency=modulated_freq * 0.25)
         
         # Add low-pass filtering for deeper tone
         filtered_bell = sf.SVFilter(bell, "low_pass", cutoff=base_freq * 6, resonance=0.2)
         
         # Slow attack envelope that repeats
         bell_env = sf.ASREnvelope(8.0, 12.0, 8.0)  # Very slow envelope
-        bell_sound = filtered_bell * bell_env * 0.15
+        bell_sound = filtered_bell * bell_env * (0.15 * FULL_SWEEP_PAN_LEVEL)
         
         # Add reverb for bells
         reverb_bell = sf.CombDelay(bell_sound, delay_time=2.0, feedback=0.9, max_delay_time=8.0)
@@ -152,8 +165,8 @@ class AmbientSoundscape:
         bell_pan_lfo = sf.SineLFO(frequency=0.03, min=-1.0, max=1.0)  # Faster pan (33 second cycle)
         bell_pan_position = bell_pan_lfo  # Full left-right sweeps
         
-        # Position in space
-        positioned = sf.SpatialPanner(self.env, reverb_bell, x=bell_pan_position, y=y_pos, z=0.0)
+        # Position in the stereo field
+        positioned = sf.StereoPanner(reverb_bell, bell_pan_position)
         
         return positioned, bell_env
     
@@ -163,24 +176,24 @@ class AmbientSoundscape:
         # Create multiple layers across the stereo field
         
         # Deep drones positioned left and right
-        drone1 = self.create_drone_layer(55, -0.8, 0.0)   # Left
-        drone2 = self.create_drone_layer(82.4, 0.8, 0.0)   # Right
+        drone1 = self.create_drone_layer(55, -0.8)   # Left
+        drone2 = self.create_drone_layer(82.4, 0.8)   # Right
         
         # Pad layers positioned across stereo field
-        pad1 = self.create_pad_layer(220, -0.5, 0.0, 0.015)  # Left side
-        pad2 = self.create_pad_layer(329.6, 0.5, 0.0, 0.025)  # Right side
-        pad3 = self.create_pad_layer(164.8, 0.0, 0.0, 0.03)   # Center
+        pad1 = self.create_pad_layer(220, -0.5, 0.015)  # Left side
+        pad2 = self.create_pad_layer(329.6, 0.5, 0.025)  # Right side
+        pad3 = self.create_pad_layer(164.8, 0.0, 0.03)   # Center
         
         # Texture layers for movement
-        texture1 = self.create_texture_layer(-0.6, 0.0)  # Left
-        texture2 = self.create_texture_layer(0.6, 0.0)    # Right
+        texture1 = self.create_texture_layer(-0.6)  # Left
+        texture2 = self.create_texture_layer(0.6)    # Right
         
         # Bell layers for sparkle
-        bell1, bell1_env = self.create_bell_layer(220, -0.7, 0.0)
-        bell2, bell2_env = self.create_bell_layer(330, 0.7, 0.0)
+        bell1, bell1_env = self.create_bell_layer(220, -0.7)
+        bell2, bell2_env = self.create_bell_layer(330, 0.7)
         
         # Mix all layers together with reduced gain to prevent clipping
-        mixed_layers = (drone1 + drone2 + pad1 + pad2 + pad3 + texture1 + texture2 + bell1 + bell2) * 0.7
+        mixed_layers = sf.Sum([drone1, drone2, pad1, pad2, pad3, texture1, texture2, bell1, bell2]) * 0.7
         
         # Apply light compression/maximizer to the mix
         compressed = sf.Compressor(mixed_layers, threshold=-18, ratio=2.5, attack_time=0.1, release_time=0.5)
@@ -198,51 +211,58 @@ class AmbientSoundscape:
         recorder = sf.BufferRecorder(buffer, eq_output)
         recorder.play()
         
-        # Also play the processed mix for real-time listening
-        eq_output.play()
-        
-        # Start bell envelopes on different schedules
-        def trigger_bells():
-            while self.running:
-                time.sleep(random.uniform(15, 30))  # Random intervals
-                if self.running:
-                    bell1_env.trigger()
-                time.sleep(random.uniform(10, 25))
-                if self.running:
-                    bell2_env.trigger()
-        
-        self.running = True
-        bell_thread = threading.Thread(target=trigger_bells)
-        bell_thread.daemon = True
-        bell_thread.start()
-        
-        # Let the composition play
-        time.sleep(duration_minutes * 60)
-        
-        # Clean up
-        self.running = False
+        # Render the graph block by block up to a point in the piece (in seconds)
+        block_size = self.graph.output_buffer_size
+        rendered_frames = 0
+        
+        def render_until(seconds):
+            nonlocal rendered_frames
+            target_frames = min(int(seconds * sample_rate), buffer.num_frames)
+            while rendered_frames < target_frames:
+                num_frames = min(block_size, target_frames - rendered_frames)
+                self.graph.render(num_frames)
+                rendered_frames += num_frames
+        
+        # Schedule bell envelopes up front as (time, bell index) events on a heap
+        # Intervals alternate bell 1 (15-30s) and bell 2 (10-25s), drawn in one call
+        # with enough pairs to cover the piece
+        bell_envs = [bell1_env, bell2_env]
+        rng = np.random.default_rng()
+        num_pairs = int(buffer_seconds // 25) + 1
+        intervals = rng.uniform([15, 10], [30, 25], size=(num_pairs, 2))  # Random intervals
+        bell_times = np.cumsum(intervals.ravel())
+        bell_events = [(float(t), i % 2) for i, t in enumerate(bell_times)]
+        heapq.heapify(bell_events)
+        
+        # Render up to each bell event in time order, then the rest of the composition
+        while bell_events and bell_events[0][0] < buffer_seconds:
+            event_time, bell_idx = heapq.heappop(bell_events)
+            render_until(event_time)
+            bell_envs[bell_idx].trigger()
+        render_until(buffer_seconds)
         
         # Export the recorded audio to WAV file
         print("Exporting audio to WAV file...")
         audio_data = buffer.data  # Shape: (channels, frames)
         
-        # Transpose for scipy (expects frames, channels)
+        # Transpose for soundfile (expects frames, channels)
         audio_data = audio_data.T
         
-        # Normalize to prevent clipping
-        max_val = np.max(np.abs(audio_data))
-        if max_val > 0:
-            audio_data = audio_data / max_val
-        
-        # Apply gentle limiting to prevent crackling
-        audio_data = np.clip(audio_data, -0.95, 0.95)
-        
-        # Convert to 16-bit integer
-        audio_data = np.int16(audio_data * 32767)
+        # Normalize to the peak (taken from the extremes, without allocating an
+        # |audio_data| copy), then stream to a 16-bit WAV file in chunks so
+        # each chunk is scaled and limited while it is still in cache
+        max_val = max(audio_data.max(), -audio_data.min())
+        scale = 1.0 / max_val if max_val > 0 else 0.0
+        chunk_frames = 65536
         
-        # Save as WAV file
         filename = f"ambient_soundscape_{duration_minutes}min.wav"
-        wavfile.write(filename, sample_rate, audio_data)
+        with soundfile.SoundFile(filename, 'w', sample_rate, 2, subtype='PCM_16') as wav_file:
+            for start in range(0, len(audio_data), chunk_frames):
+                chunk = audio_data[start:start + chunk_frames] * scale
+                
+                # Apply gentle limiting to prevent crackling
+                np.clip(chunk, -0.95, 0.95, out=chunk)
+                wav_file.write(chunk)
         print(f"Audio exported to: {filename}")
         
         self.graph.stop()
@@ -265,7 +285,6 @@ def main():
         soundscape.start_composition(duration_minutes=3)  # 3-minute demo
     except KeyboardInterrupt:
         print("\nStopping soundscape...")
-        soundscape.running = False
         soundscape.graph.stop()
         soundscape.graph.destroy()
 
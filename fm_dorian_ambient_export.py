@@ -1,10 +1,36 @@
 #!/usr/bin/env python3
 
 import signalflow as sf
-import time
-import random
+import math
 import numpy as np
-from scipy.io import wavfile
+import soundfile
+
+# Offline render settings: sample rate and the block size the graph renders in
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 512
+
+# Timing - 4 measures of 4 beats per chord at 82 BPM
+BPM = 82
+MEASURES_PER_CHORD = 4
+BEATS_PER_MEASURE = 4
+CHORD_DURATION = (MEASURES_PER_CHORD * BEATS_PER_MEASURE * 60) / BPM  # 11.71 seconds
+TOTAL_DURATION = 180.0  # 3 minutes
+ECHO_DELAY_TIME = (2 * 60) / BPM  # Half-measure = 2 beats (1.46 seconds)
+ECHO_MAX_DELAY_TIME = 2.0
+DRONE_RETRIGGER_INTERVAL = (5 * 4 * 60) / BPM  # 5 measures (14.63 seconds)
+
+# Define 4 different chord intervals in C Dorian mode with optional 7ths
+# C Dorian: C D Eb F G A Bb C
+CHORD_DEFINITIONS = [
+    [('C3', 130.81), ('F3', 174.61), ('Bb3', 233.08)],   # C - F - Bb (C minor 7th)
+    [('D3', 146.83), ('G3', 196.00), ('C4', 261.63)],    # D - G - C (D minor 7th) 
+    [('F3', 174.61), ('Bb3', 233.08), ('Eb4', 311.13)],  # F - Bb - Eb (F minor 7th)
+    [('G3', 196.00), ('C4', 261.63), ('F4', 349.23)]     # G - C - F (G minor 7th)
+]
+
+def create_offline_graph():
+    """Create an audio graph with a dummy output, rendering offline as fast as the CPU allows"""
+    return sf.AudioGraph(output_device=sf.AudioOut_Dummy(2, SAMPLE_RATE, BLOCK_SIZE), start=False)
 
 def create_electric_keyboard_note(frequency, velocity=1.0):
     """Create an electric keyboard sound using FM synthesis"""
@@ -49,77 +75,48 @@ def create_electric_keyboard_note(frequency, velocity=1.0):
     
     return final * 0.08, mod_env, carrier_env, gate
 
-def export_to_wav(filename="dorian_ambient_3min.wav"):
-    """Export the 3-minute ambient piece to a WAV file"""
-    print(f"Exporting Dorian ambient piece to {filename}...")
-    
-    # Initialize audio graph
-    graph = sf.AudioGraph()
-    
-    # Calculate timing first
-    bpm = 82
-    measures_per_chord = 4
-    beats_per_measure = 4
-    chord_duration = (measures_per_chord * beats_per_measure * 60) / bpm  # 11.71 seconds
-    total_duration = 180.0  # 3 minutes
-    
-    # Define 4 different chord intervals in C Dorian mode with optional 7ths
-    # C Dorian: C D Eb F G A Bb C
-    chord_definitions = [
-        [('C3', 130.81), ('F3', 174.61), ('Bb3', 233.08)],   # C - F - Bb (C minor 7th)
-        [('D3', 146.83), ('G3', 196.00), ('C4', 261.63)],    # D - G - C (D minor 7th) 
-        [('F3', 174.61), ('Bb3', 233.08), ('Eb4', 311.13)],  # F - Bb - Eb (F minor 7th)
-        [('G3', 196.00), ('C4', 261.63), ('F4', 349.23)]     # G - C - F (G minor 7th)
-    ]
+def build_voice_bank():
+    """Build the drone, shimmer and chord voices, all feeding one master mix"""
     
     # Create all possible voices for all chord notes
     all_voices = {}
     
     # Create voices for each unique note
     unique_notes = {}
-    for chord in chord_definitions:
+    for chord in CHORD_DEFINITIONS:
         for note_name, freq in chord:
             if note_name not in unique_notes:
                 unique_notes[note_name] = freq
     
     print(f"Creating voices for notes: {list(unique_notes.keys())}")
     
-    # Create master mixer for recording
-    master_mix = sf.Sum()
+    # Collect every layer, then build the master mix for recording in one go
+    mix_inputs = []
     
     # Create continuous drone voice (C2 - low C for foundational drone)
     drone_freq = 65.41  # C2
     drone_voice, drone_mod_env, drone_carrier_env, drone_gate = create_electric_keyboard_note(drone_freq, velocity=0.1)
     
-    # Add heavy reverb to drone for atmospheric effect
-    drone_reverb1 = sf.CombDelay(drone_voice, delay_time=0.3, feedback=0.8, max_delay_time=1.0)
-    drone_reverb2 = sf.CombDelay(drone_voice, delay_time=0.45, feedback=0.7, max_delay_time=1.0)
-    drone_reverb3 = sf.CombDelay(drone_voice, delay_time=0.6, feedback=0.6, max_delay_time=1.0)
-    
-    # Mix drone with heavy reverb
-    drone_output = (drone_voice * 0.3 + 
-                   drone_reverb1 * 0.4 + 
-                   drone_reverb2 * 0.2 + 
-                   drone_reverb3 * 0.1)
+    # Center the dry drone in stereo field (reverb comes from the ambient bus below)
+    drone_stereo = sf.StereoPanner(drone_voice * 0.3, 0.0)
+    mix_inputs.append(drone_stereo)
     
-    # Center the drone in stereo field
-    drone_stereo = sf.StereoPanner(drone_output, 0.0)
-    master_mix.add_input(drone_stereo)
-    
-    # Start the drone immediately
-    drone_gate.set_value(1)
-    drone_mod_env.trigger()
-    drone_carrier_env.trigger()
-    print("Started continuous C2 drone")
+    print("Created continuous C2 drone")
     
     # Create ethereal shimmer layer - starting at C5
     shimmer_freq1 = 523.25  # C5
     shimmer_freq2 = 1046.5  # C6 (one octave above C5)
     
-    # Create LFOs for organic movement (slowed to 1/3 rate)
-    shimmer_lfo1 = sf.SineLFO(0.023, 0.95, 1.05)  # Ultra slow frequency modulation
-    shimmer_lfo2 = sf.SineLFO(0.037, 0.0, 0.3)    # Ultra slow amplitude modulation
-    shimmer_lfo3 = sf.SineLFO(0.043, -0.8, 0.8)   # Ultra slow stereo panning
+    # Create LFOs for organic movement (slowed to 1/3 rate). They are far below
+    # audio rate, so they are constants updated once per render block
+    shimmer_lfo1 = sf.Constant(1.0)   # Ultra slow frequency modulation
+    shimmer_lfo2 = sf.Constant(0.15)  # Ultra slow amplitude modulation
+    shimmer_lfo3 = sf.Constant(0.0)   # Ultra slow stereo panning
+    control_lfos = [
+        (shimmer_lfo1, 0.023, 0.95, 1.05),
+        (shimmer_lfo2, 0.037, 0.0, 0.3),
+        (shimmer_lfo3, 0.043, -0.8, 0.8)
+    ]
     
     # Create the shimmer oscillators with LFO modulation
     shimmer_osc1 = sf.SineOscillator(shimmer_freq1 * shimmer_lfo1)
@@ -131,17 +128,28 @@ def export_to_wav(filename="dorian_ambient_3min.wav"):
     # Add high-frequency EQ cut around 8kHz using low-pass filter
     shimmer_filtered = sf.SVFilter(shimmer_mix, "low_pass", cutoff=8000, resonance=0.3)  # Gentle roll-off above 8kHz
     
-    # Add ethereal reverb to shimmer
-    shimmer_reverb1 = sf.CombDelay(shimmer_filtered, delay_time=0.8, feedback=0.85, max_delay_time=2.0)
-    shimmer_reverb2 = sf.CombDelay(shimmer_filtered, delay_time=1.1, feedback=0.75, max_delay_time=2.0)
-    shimmer_with_reverb = shimmer_filtered + shimmer_reverb1 * 0.6 + shimmer_reverb2 * 0.4
-    
     # Apply dynamic stereo panning to shimmer for movement
-    shimmer_stereo = sf.StereoPanner(shimmer_with_reverb, shimmer_lfo3)
-    master_mix.add_input(shimmer_stereo)
+    shimmer_stereo = sf.StereoPanner(shimmer_filtered, shimmer_lfo3)
+    mix_inputs.append(shimmer_stereo)
     
     print("Added ethereal shimmer layer")
     
+    # Ambient reverb bus - shimmer and drone share one ethereal reverb pair, with
+    # delay lines sized to the longest delay so the pair stays compact in cache
+    ambient_send = shimmer_filtered + drone_voice * 0.5
+    ambient_reverb1 = sf.CombDelay(ambient_send, delay_time=0.8, feedback=0.85, max_delay_time=1.1)
+    ambient_reverb2 = sf.CombDelay(ambient_send, delay_time=1.1, feedback=0.75, max_delay_time=1.1)
+    
+    # Spread the pair across left and right with a 2x2 mixing matrix, so the
+    # diffuse reverb is decorrelated between channels (0.6/0.4 weights at the
+    # -3 dB center-pan level)
+    ambient_stereo = sf.ChannelArray([ambient_reverb1 * 0.42 + ambient_reverb2 * 0.28,
+                                      ambient_reverb1 * 0.28 + ambient_reverb2 * 0.42])
+    mix_inputs.append(ambient_stereo)
+    
+    # Shared reverb send - all chord voices feed one set of reverb stages
+    reverb_sends = []
+    
     # Create chord voices
     for note_name, freq in unique_notes.items():
         voice, mod_env, carrier_env, gate = create_electric_keyboard_note(freq, velocity=0.2)
@@ -154,56 +162,20 @@ def export_to_wav(filename="dorian_ambient_3min.wav"):
         
         stereo_voice = sf.StereoPanner(voice, pan_pos)
         
-        # Add rhythmic delay effect - half-measure delay (1.46 seconds at 82 BPM)
-        delay_time = (2 * 60) / bpm  # Half-measure = 2 beats
-        
-        # Create multiple feedback delays for repeating echoes (24 echoes total for longer tail)
-        delay1 = sf.OneTapDelay(stereo_voice, delay_time=delay_time, max_delay_time=12.0)
-        delay2 = sf.OneTapDelay(delay1, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay3 = sf.OneTapDelay(delay2, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay4 = sf.OneTapDelay(delay3, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay5 = sf.OneTapDelay(delay4, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay6 = sf.OneTapDelay(delay5, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay7 = sf.OneTapDelay(delay6, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay8 = sf.OneTapDelay(delay7, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay9 = sf.OneTapDelay(delay8, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay10 = sf.OneTapDelay(delay9, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay11 = sf.OneTapDelay(delay10, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay12 = sf.OneTapDelay(delay11, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay13 = sf.OneTapDelay(delay12, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay14 = sf.OneTapDelay(delay13, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay15 = sf.OneTapDelay(delay14, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay16 = sf.OneTapDelay(delay15, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay17 = sf.OneTapDelay(delay16, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay18 = sf.OneTapDelay(delay17, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay19 = sf.OneTapDelay(delay18, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay20 = sf.OneTapDelay(delay19, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay21 = sf.OneTapDelay(delay20, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay22 = sf.OneTapDelay(delay21, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay23 = sf.OneTapDelay(delay22, delay_time=delay_time, max_delay_time=12.0) * 0.8
-        delay24 = sf.OneTapDelay(delay23, delay_time=delay_time, max_delay_time=12.0) * 0.8
+        # Add rhythmic delay effect - feedback comb at a half-measure delay,
+        # each repeat decays by 0.75 for a long tail
+        echoes = sf.CombDelay(stereo_voice, delay_time=ECHO_DELAY_TIME, feedback=0.75,
+                              max_delay_time=ECHO_MAX_DELAY_TIME)
         
-        # Mix all delay taps with heavily reduced levels to prevent buffer overrun
-        delay_output = (delay1 * 0.3 + delay2 * 0.28 + delay3 * 0.26 + delay4 * 0.24 + 
-                       delay5 * 0.22 + delay6 * 0.2 + delay7 * 0.18 + delay8 * 0.16 + 
-                       delay9 * 0.14 + delay10 * 0.12 + delay11 * 0.1 + delay12 * 0.09 + 
-                       delay13 * 0.08 + delay14 * 0.07 + delay15 * 0.06 + delay16 * 0.05 +
-                       delay17 * 0.04 + delay18 * 0.03 + delay19 * 0.025 + delay20 * 0.02 +
-                       delay21 * 0.015 + delay22 * 0.01 + delay23 * 0.008 + delay24 * 0.005)
+        # Remove the dry signal so only the echo taps remain, first tap at 0.3
+        delay_output = (echoes - stereo_voice) * 0.4
         
-        # Add multiple reverb stages for spacious feeling
-        reverb1 = sf.CombDelay(stereo_voice, delay_time=0.18, feedback=0.75, max_delay_time=1.0)
-        reverb2 = sf.CombDelay(stereo_voice, delay_time=0.27, feedback=0.65, max_delay_time=1.0)
-        reverb3 = sf.CombDelay(stereo_voice, delay_time=0.35, feedback=0.55, max_delay_time=1.0)
-        reverb4 = sf.CombDelay(stereo_voice, delay_time=0.43, feedback=0.45, max_delay_time=1.0)
+        # Send the voice to the shared reverb bus
+        reverb_sends.append(stereo_voice)
         
-        # Mix dry signal, delay, and multiple reverbs (extremely reduced for stability)
+        # Mix dry signal and delay (extremely reduced for stability)
         final_voice = (stereo_voice * 0.03 + 
-                      delay_output * 0.1 +
-                      reverb1 * 0.03 + 
-                      reverb2 * 0.015 + 
-                      reverb3 * 0.003 + 
-                      reverb4 * 0.0)
+                      delay_output * 0.1)
         
         all_voices[note_name] = {
             'output': final_voice,
@@ -214,129 +186,208 @@ def export_to_wav(filename="dorian_ambient_3min.wav"):
         }
         
         # Connect to master mix
-        master_mix.add_input(final_voice)
+        mix_inputs.append(final_voice)
+    
+    reverb_send = sf.Sum(reverb_sends)
+    
+    # Add multiple reverb stages for spacious feeling on the shared bus
+    bus_reverb1 = sf.CombDelay(reverb_send, delay_time=0.18, feedback=0.75, max_delay_time=1.0)
+    bus_reverb2 = sf.CombDelay(reverb_send, delay_time=0.27, feedback=0.65, max_delay_time=1.0)
+    bus_reverb3 = sf.CombDelay(reverb_send, delay_time=0.35, feedback=0.55, max_delay_time=1.0)
+    
+    # Mix reverb stages (extremely reduced for stability)
+    reverb_bus = (bus_reverb1 * 0.03 + 
+                  bus_reverb2 * 0.015 + 
+                  bus_reverb3 * 0.003)
+    mix_inputs.append(reverb_bus)
+    
+    master_mix = sf.Sum(mix_inputs)
+    
+    return {
+        'master_mix': master_mix,
+        'drone': {
+            'mod_env': drone_mod_env,
+            'carrier_env': drone_carrier_env,
+            'gate': drone_gate
+        },
+        'chords': all_voices,
+        'control_lfos': control_lfos
+    }
+
+def render_sequence(graph, voices, chord_sequence, buffer, rng):
+    """Render a chord sequence into buffer offline, triggering notes on their exact frames"""
     
-    # Create recording buffer and recorder
-    sample_rate = graph.sample_rate
-    buffer = sf.Buffer(2, int(sample_rate * total_duration))  # Stereo buffer
-    recorder = sf.BufferRecorder(buffer, master_mix)
+    # Clear the buffer so it can be reused across renders, then record the master mix
+    buffer.data[:] = 0
+    recorder = sf.BufferRecorder(buffer, voices['master_mix'])
     recorder.play()
     
-    print(f"Each chord will be sustained for {chord_duration} seconds")
-    
-    # Create random chord sequence for 3 minutes
-    num_chords = int(total_duration / chord_duration)  # About 15 chords
-    
-    # Generate random chord sequence
-    random.seed(42)  # For reproducible randomness
-    chord_sequence = []
-    for i in range(num_chords):
-        chord_idx = random.randint(0, 3)
-        chord_sequence.append(chord_idx)
-    
-    print(f"Generated random sequence of {len(chord_sequence)} chords")
-    print("Chord sequence:", [f"Chord {i+1}" for i in chord_sequence])
-    
-    # Play the sequence
-    start_time = time.time()
+    # Render the graph block by block up to a point in the piece (in seconds)
+    sample_rate = graph.sample_rate
+    total_frames = buffer.num_frames
+    block_size = graph.output_buffer_size
+    rendered_frames = 0
+    control_lfos = voices['control_lfos']
+    
+    def render_until(seconds):
+        nonlocal rendered_frames
+        target_frames = min(int(seconds * sample_rate), total_frames)
+        while rendered_frames < target_frames:
+            # Advance the control-rate LFOs to the start of this block
+            phase = 2 * math.pi * rendered_frames / sample_rate
+            for lfo, frequency, lfo_min, lfo_max in control_lfos:
+                lfo.set_value(lfo_min + (lfo_max - lfo_min) * (0.5 + 0.5 * math.sin(phase * frequency)))
+            
+            num_frames = min(block_size, target_frames - rendered_frames)
+            graph.render(num_frames)
+            rendered_frames += num_frames
+    
+    # Build the whole note schedule up front as (time, voice) events,
+    # starting the drone immediately
+    drone = voices['drone']
+    all_voices = voices['chords']
     last_drone_trigger = 0  # Track when we last triggered the drone
+    sequence_end = 0.0  # When the last scheduled chord has played its full duration
+    schedule = [(0.0, drone)]
+    
+    # Draw every note offset (up to 0.5 seconds) and 7th choice (70% chance) in bulk
+    num_chords = len(chord_sequence)
+    offsets = rng.uniform(0.0, 0.5, size=(num_chords, 3))
+    include_seventh = rng.random(num_chords) < 0.7
     
     for seq_idx, chord_idx in enumerate(chord_sequence):
-        chord_notes = chord_definitions[chord_idx]
-        chord_name = f"Chord {chord_idx + 1}: {chord_notes[0][0]}-{chord_notes[1][0]}"
-        
-        current_time = time.time() - start_time
+        chord_notes = CHORD_DEFINITIONS[chord_idx]
+        chord_time = seq_idx * CHORD_DURATION
         
         # Re-trigger drone every 5 measures (5 * 4 beats * 60s / 82 BPM = 14.63 seconds)
-        drone_retrigger_interval = (5 * 4 * 60) / bpm  # 5 measures
-        if current_time - last_drone_trigger >= drone_retrigger_interval:
-            drone_mod_env.trigger()
-            drone_carrier_env.trigger()
-            last_drone_trigger = current_time
-            print(f"Re-triggered drone at {current_time:.1f}s")
+        if chord_time - last_drone_trigger >= DRONE_RETRIGGER_INTERVAL:
+            schedule.append((chord_time, drone))
+            last_drone_trigger = chord_time
+            print(f"Re-triggering drone at {chord_time:.1f}s")
         
-        # Trigger chord notes with random timing (including optional 7th)
-        chord_triggers = []
+        # Schedule chord notes with random timing (including optional 7th)
+        played_notes = []
         
         # Always include the first two notes (root and 5th/4th)
         for i in range(2):
             note_name, freq = chord_notes[i]
-            offset = random.uniform(0.0, 0.5)  # Random offset up to 0.5 seconds
-            chord_triggers.append((offset, note_name))
+            schedule.append((chord_time + offsets[seq_idx, i], all_voices[note_name]))
+            played_notes.append(note_name)
         
-        # Randomly include the 7th (third note) - 70% chance
-        if len(chord_notes) > 2 and random.random() < 0.7:
+        # Randomly include the 7th (third note)
+        if len(chord_notes) > 2 and include_seventh[seq_idx]:
             note_name, freq = chord_notes[2]  # The 7th
-            offset = random.uniform(0.0, 0.5)
-            chord_triggers.append((offset, note_name))
-        
-        # Sort by offset time
-        chord_triggers.sort(key=lambda x: x[0])
+            schedule.append((chord_time + offsets[seq_idx, 2], all_voices[note_name]))
+            played_notes.append(note_name)
         
         # Show what notes are being played
-        played_notes = [note_name for offset, note_name in chord_triggers]
-        has_seventh = len(chord_triggers) > 2
-        seventh_indicator = " (+7th)" if has_seventh else ""
-        print(f"Time {current_time:.1f}s: Playing {played_notes}{seventh_indicator}")
-        
-        # Trigger notes with their calculated offsets
-        start_chord_time = time.time()
-        for offset, note_name in chord_triggers:
-            # Wait until it's time for this note
-            elapsed = time.time() - start_chord_time
-            if offset > elapsed:
-                time.sleep(offset - elapsed)
-            
-            voice = all_voices[note_name]
-            voice['gate'].set_value(1)
-            voice['mod_env'].trigger()
-            voice['carrier_env'].trigger()
-        
-        # Wait for chord duration (accounting for maximum random offset)
-        time.sleep(chord_duration - 0.5)  # Subtract the maximum offset time
+        seventh_indicator = " (+7th)" if len(played_notes) > 2 else ""
+        print(f"Time {chord_time:.1f}s: Playing {played_notes}{seventh_indicator}")
+        sequence_end = chord_time + CHORD_DURATION
         
         # Check if we're approaching 3 minutes
-        if time.time() - start_time > 170:  # Stop triggering new chords near the end
+        if chord_time + CHORD_DURATION > 170:  # Stop triggering new chords near the end
             break
     
-    # Let final chord ring out to complete 3 minutes
-    final_time = time.time() - start_time
-    remaining_time = 180.0 - final_time
+    # Sort once so the render loop only walks forward in time
+    schedule.sort(key=lambda event: event[0])
+    
+    # Play the sequence, rendering up to the moment each note starts
+    for event_time, voice in schedule:
+        render_until(event_time)
+        voice['gate'].set_value(1)
+        voice['mod_env'].trigger()
+        voice['carrier_env'].trigger()
     
+    # Let final chord ring out to complete 3 minutes
+    remaining_time = TOTAL_DURATION - sequence_end
     if remaining_time > 0:
         print(f"Letting final chord decay for {remaining_time:.1f} seconds...")
-        time.sleep(remaining_time)
+    render_until(TOTAL_DURATION)
+    recorder.stop()
+
+def export_to_wav(filename="dorian_ambient_3min.wav", seed=42, graph=None, buffer=None):
+    """Export the 3-minute ambient piece to a WAV file
+    
+    Pass in the graph and buffer from a previous export to render another
+    variation without recreating them. The voices are always built fresh, so
+    no delay line, envelope or oscillator state carries over between renders
+    and each seed sounds the same however it is exported.
+    """
+    print(f"Exporting Dorian ambient piece to {filename}...")
+    
+    # Initialize an offline audio graph unless one was passed in
+    owns_graph = graph is None
+    if owns_graph:
+        graph = create_offline_graph()
+    voices = build_voice_bank()
+    
+    # Create recording buffer
+    sample_rate = graph.sample_rate
+    if buffer is None:
+        buffer = sf.Buffer(2, int(sample_rate * TOTAL_DURATION))  # Stereo buffer
+    
+    print(f"Each chord will be sustained for {CHORD_DURATION} seconds")
+    
+    # Create random chord sequence for 3 minutes
+    num_chords = int(TOTAL_DURATION / CHORD_DURATION)  # About 15 chords
+    
+    # Generate random chord sequence
+    rng = np.random.default_rng(seed)  # For reproducible randomness
+    chord_sequence = rng.integers(0, 4, size=num_chords)
+    
+    print(f"Generated random sequence of {len(chord_sequence)} chords")
+    print("Chord sequence:", [f"Chord {i+1}" for i in chord_sequence])
+    
+    render_sequence(graph, voices, chord_sequence, buffer, rng)
     
     print("Recording complete, processing audio...")
     
-    # Export to WAV
+    # Export to WAV - a transposed view of the recording, no copy
     audio_data = buffer.data.T  # Transpose for correct channel format
     
     # Normalize to prevent clipping
-    max_val = np.max(np.abs(audio_data))
+    max_val = max(audio_data.max(), -audio_data.min())  # Peak without an |audio_data| copy
     if max_val > 0:
-        audio_data = audio_data / max_val * 0.9  # Leave some headroom
+        scale = 0.9 / max_val  # Leave some headroom
     else:
         print("Warning: No audio data recorded!")
-        audio_data = np.zeros_like(audio_data)
-    
-    # Convert to 16-bit integer
-    audio_data = np.int16(audio_data * 32767)
+        scale = 0.0
     
-    # Write WAV file
-    wavfile.write(filename, sample_rate, audio_data)
+    # Write 16-bit WAV file in chunks - each scaled chunk is a small contiguous
+    # copy, so the full transposed recording is never copied at once, and
+    # libsndfile converts from float as it writes
+    chunk_frames = 65536
+    with soundfile.SoundFile(filename, 'w', sample_rate, 2, subtype='PCM_16') as wav_file:
+        for start in range(0, len(audio_data), chunk_frames):
+            wav_file.write(audio_data[start:start + chunk_frames] * scale)
     
     # Clean up
-    graph.stop()
-    graph.destroy()
+    if owns_graph:
+        graph.stop()
+        graph.destroy()
     
     print(f"Successfully exported to {filename}")
-    print(f"Duration: {total_duration} seconds")
+    print(f"Duration: {TOTAL_DURATION} seconds")
     print(f"Sample rate: {sample_rate} Hz")
     print(f"Channels: 2 (stereo)")
     
     return filename
 
+def export_variations(seeds):
+    """Export one WAV file per seed, sharing a single audio graph and recording buffer"""
+    graph = create_offline_graph()
+    buffer = sf.Buffer(2, int(graph.sample_rate * TOTAL_DURATION))
+    
+    filenames = []
+    for seed in seeds:
+        filename = f"dorian_ambient_3min_seed{seed}.wav"
+        filenames.append(export_to_wav(filename, seed, graph, buffer))
+    
+    graph.stop()
+    graph.destroy()
+    return filenames
+
 if __name__ == "__main__":
     filename = "dorian_ambient_3min.wav"
     export_to_wav(filename)
\ No newline at end of file
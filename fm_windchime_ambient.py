@@ -1,64 +1,100 @@
 #!/usr/bin/env python3
 
 import signalflow as sf
-import time
-import threading
-import random
+import math
+import tempfile
 import numpy as np
-from scipy.io import wavfile
+import soundfile
+
+# Offline render settings: sample rate and the block size the graph renders in
+SAMPLE_RATE = 44100
+BLOCK_SIZE = 512
+
+# Seconds a bell keeps sounding after a trigger: carrier envelope
+# attack + sustain + release (0.01 + 0.5 + 4.5) plus a little filter tail
+BELL_RING_TIME = 5.5
+
+# Seconds of audio held in memory while recording; each full segment is
+# flushed to a disk-backed array so long pieces don't need it all in RAM
+RECORD_SEGMENT_SECONDS = 30
+
+# Shortest graph render, in frames. signalflow warns "buffer overrun?" whenever a
+# render takes longer than its frames would last in real time, which tiny renders
+# always do, so strikes are moved by up to this many frames to avoid them
+MIN_RENDER_FRAMES = 64
+
+# Chimes are never closer together than this, in seconds
+MIN_CHIME_INTERVAL = 0.4
+
+def chime_interval(t, gust, jitter):
+    """Seconds until the next chime at time t, given a gust boost and timing jitter"""
+    # Base wind strength (0-1) - math.sin avoids NumPy ufunc dispatch on a scalar
+    base_wind = min(1.0, 0.3 + 0.7 * (0.5 + 0.5 * math.sin(t * 0.02)) + gust)
+    
+    # Interval between chimes based on wind - increased for more space
+    base_interval = 1.5
+    interval = base_interval * (2.5 - base_wind) + jitter
+    return max(MIN_CHIME_INTERVAL, interval)
+
+def asr_table(attack, sustain, release, sample_rate):
+    """One linear attack-sustain-release envelope, sampled from trigger to silence"""
+    duration = attack + sustain + release
+    t = np.arange(int(duration * sample_rate) + 1) / sample_rate
+    return np.clip(np.minimum(t / attack, (duration - t) / release), 0.0, 1.0).astype(np.float32)
 
 class FMWindChimeAmbience:
     def __init__(self):
-        self.graph = sf.AudioGraph()
-        self.running = False
+        # Dummy output device lets the graph render offline, faster than real time
+        self.graph = sf.AudioGraph(output_device=sf.AudioOut_Dummy(2, SAMPLE_RATE, BLOCK_SIZE), start=False)
+        
+        # Bell envelopes are the same for every bell, so each is computed once as
+        # a table that bells play back on trigger instead of running an ASR each
+        sample_rate = self.graph.sample_rate
+        self.mod_env_table = sf.Buffer(asr_table(0.001, 0.1, 1.5, sample_rate))  # Fast attack, longer release
+        self.carrier_env_table = sf.Buffer(asr_table(0.01, 0.5, 4.5, sample_rate))  # Extended release for more ambient sustain
         
-    def create_fm_bell(self, frequency, velocity=0.7):
-        """Create an FM-synthesized bell with velocity control"""
+    def create_fm_bell(self, frequency, cutoff, velocity=0.7):
+        """Create an FM-synthesized bell with velocity control, low-passed at cutoff"""
         
         # FM synthesis parameters - reduced for less distortion
         mod_ratio = 3.5  # Metallic timbre
         mod_index = 0.8 * velocity  # Reduced from 1.5 to prevent distortion
         
-        # Create a master gate to control when the bell can sound
-        master_gate = sf.Constant(0)  # Start silent
-        
         # Modulator
         modulator = sf.SineOscillator(frequency * mod_ratio)
-        mod_env = sf.ASREnvelope(0.001, 0.1, 1.5)  # Fast attack, longer release
+        mod_env = sf.BufferPlayer(self.mod_env_table)
         
         # Scale modulation properly - divide by carrier frequency for stable FM
         modulation = modulator * mod_env * mod_index
         
-        # Carrier with FM
-        carrier = sf.SineOscillator(frequency * (1.0 + modulation))
-        carrier_env = sf.ASREnvelope(0.01, 0.5, 4.5)  # Extended release for more ambient sustain
-        
-        # Apply carrier envelope with reduced amplitude
-        bell = carrier * carrier_env * 0.3
+        carrier_env = sf.BufferPlayer(self.carrier_env_table)
         
-        # Add harmonics for richness with lower levels
-        harm2 = sf.SineOscillator(frequency * 2.0) * carrier_env * 0.1
-        harm3 = sf.SineOscillator(frequency * 2.95) * carrier_env * 0.05  # Slightly inharmonic
+        # FM carrier plus harmonics for richness, run as one 3-channel oscillator
+        partials = sf.SineOscillator(sf.ChannelArray([
+            frequency * (1.0 + modulation),  # Carrier with FM
+            frequency * 2.0,
+            frequency * 2.95,  # Slightly inharmonic
+        ]))
         
-        # Mix components with overall velocity scaling
-        mixed = (bell + harm2 + harm3) * velocity * 0.5
+        # Carrier at reduced amplitude, harmonics at lower levels, mixed to mono
+        partial_levels = sf.ChannelArray([0.3, 0.1, 0.05])
+        partials_mix = sf.ChannelMixer(1, partials * partial_levels, amplitude_compensation=False)
         
-        # Apply master gate to control output
-        gated = mixed * master_gate
+        # Apply carrier envelope with overall velocity scaling
+        mixed = partials_mix * carrier_env * (velocity * 0.5)
         
         # Gentle high-frequency damping for warmth
-        filtered = sf.SVFilter(gated, "low_pass", cutoff=min(frequency * 8, 8000), resonance=0.2)
-        
-        # Add reverb for space with reduced feedback
-        reverb = sf.CombDelay(filtered, delay_time=0.2, feedback=0.4, max_delay_time=2.0)
-        final = filtered * 0.8 + reverb * 0.2
+        filtered = sf.SVFilter(mixed, "low_pass", cutoff=cutoff, resonance=0.2)
         
-        return final, mod_env, carrier_env, master_gate
+        return filtered, mod_env, carrier_env
     
     def create_wind_texture(self):
         """Create subtle wind sound that modulates chime activity"""
+        # One noise source feeds both the band-passed wind and the low rumble
+        noise = sf.WhiteNoise()
+        
         # Wind base - reduced volume
-        wind_noise = sf.WhiteNoise() * 0.015
+        wind_noise = noise * 0.015
         
         # Filter for wind character
         wind_filtered = sf.SVFilter(wind_noise, "band_pass", cutoff=800, resonance=0.3)
@@ -70,7 +106,7 @@ class FMWindChimeAmbience:
         wind = wind_filtered * wind_lfo
         
         # Add some low frequency rumble - reduced
-        low_noise = sf.WhiteNoise() * 0.01
+        low_noise = noise * 0.01
         low_filtered = sf.SVFilter(low_noise, "low_pass", cutoff=200, resonance=0.1)
         
         # Mix wind components
@@ -81,6 +117,71 @@ class FMWindChimeAmbience:
         
         return wind_mix + wind_reverb * 0.3, wind_lfo
     
+    def schedule_chimes(self, num_chimes, duration_seconds, rng):
+        """Plan every chime strike up front as time-ordered (time, chime index) events"""
+        events = []
+        last_hit = [-math.inf] * num_chimes
+        current_time = 0.0
+        
+        # Draw the wind model's randomness in bulk - gusts (10% chance each)
+        # and interval jitter - for as many steps as could fit in the piece
+        max_steps = int(duration_seconds / MIN_CHIME_INTERVAL) + 1
+        gusts = np.where(rng.random(max_steps) < 0.1, rng.uniform(0.2, 0.4, max_steps), 0.0).tolist()
+        jitters = rng.uniform(-0.3, 0.3, max_steps).tolist()
+        
+        for gust, jitter in zip(gusts, jitters):
+            # Wind strength affects chime frequency
+            current_time += chime_interval(current_time, gust, jitter)
+            if current_time >= duration_seconds:
+                break
+            
+            # Select chimes that haven't been hit recently
+            available = []
+            for i in range(num_chimes):
+                if current_time - last_hit[i] > 1.5:  # 1.5 second cooldown for more space
+                    available.append(i)
+            
+            if available:
+                # Random chance for adjacent bells to ring together
+                selected = []
+                first_idx = available[rng.integers(len(available))]
+                selected.append(first_idx)
+                
+                # 30% chance for adjacent bells
+                if rng.random() < 0.3:
+                    adjacent_candidates = []
+                    for idx in available:
+                        if abs(idx - first_idx) == 1 and idx not in selected:
+                            adjacent_candidates.append(idx)
+                    
+                    if adjacent_candidates:
+                        # Can select 1-2 adjacent bells
+                        num_adjacent = rng.integers(1, min(2, len(adjacent_candidates)) + 1)
+                        selected.extend(rng.choice(adjacent_candidates, num_adjacent, replace=False).tolist())
+                
+                # Small chance for distant harmony
+                elif rng.random() < 0.15:
+                    # Look for harmonic intervals (3rd, 5th)
+                    harmony_candidates = []
+                    for idx in available:
+                        interval = abs(idx - first_idx)
+                        if interval in [2, 4] and idx not in selected:  # 3rd or 5th in scale
+                            harmony_candidates.append(idx)
+                    
+                    if harmony_candidates:
+                        selected.append(harmony_candidates[rng.integers(len(harmony_candidates))])
+                
+                # Strike selected chimes
+                for i, idx in enumerate(selected):
+                    # Strike with slight delay for rolling effect
+                    if i > 0:
+                        current_time += rng.uniform(0.02, 0.08)
+                    
+                    events.append((current_time, idx))
+                    last_hit[idx] = current_time
+        
+        return events
+    
     def start_composition(self, duration_minutes=3):
         """Create a 3-minute ambient wind chime composition"""
         print(f"Starting {duration_minutes}-minute FM wind chime ambient piece...")
@@ -89,7 +190,7 @@ class FMWindChimeAmbience:
         wind_sound, wind_strength = self.create_wind_texture()
         
         # Define chime frequencies (pentatonic scale across 2 octaves)
-        chime_freqs = [
+        chime_freqs = np.array([
             220.0,   # A3
             246.94,  # B3
             293.66,  # D4
@@ -99,31 +200,38 @@ class FMWindChimeAmbience:
             493.88,  # B4
             587.33,  # D5
             659.25,  # E5
-        ]
+        ])
         
-        # Create chime components
+        # Positions across the stereo field, left to right
+        pan_positions = np.linspace(-0.8, 0.8, len(chime_freqs))
+        
+        # Bell damping cutoffs, 3 octaves above each chime (capped at 8 kHz)
+        cutoffs = np.minimum(chime_freqs * 8, 8000)
+        
+        # Create chime components (signalflow wants plain floats, hence tolist)
         chimes = []
-        for i, freq in enumerate(chime_freqs):
-            bell, mod_env, carrier_env, master_gate = self.create_fm_bell(freq)
+        for freq, pan_pos, cutoff in zip(chime_freqs.tolist(), pan_positions.tolist(), cutoffs.tolist()):
+            bell, mod_env, carrier_env = self.create_fm_bell(freq, cutoff)
             
-            # Position across stereo field
-            pan_pos = -0.8 + (i / (len(chime_freqs) - 1)) * 1.6
             panned_bell = sf.StereoPanner(bell, pan_pos)
             
             chimes.append({
                 'output': panned_bell,
                 'mod_env': mod_env,
                 'carrier_env': carrier_env,
-                'master_gate': master_gate,
                 'freq': freq,
-                'last_hit': 0
+                # Bound envelope triggers, looked up once rather than per strike
+                'trigger_fns': (mod_env.trigger, carrier_env.trigger)
             })
-            
-            # Set up the bell audio path
-            panned_bell.play()
         
-        # Mix all sounds with reduced levels
-        all_chimes = sum(chime['output'] for chime in chimes)
+        # Mix all sounds with reduced levels - one Sum node rather than a chain of adds.
+        # Bells start silent and only join the mix while ringing, so idle bells
+        # are not synthesized at all
+        chimes_dry = sf.Sum([])
+        
+        # Shared reverb send for all bells, with reduced feedback
+        chimes_reverb = sf.CombDelay(chimes_dry, delay_time=0.2, feedback=0.4, max_delay_time=2.0)
+        all_chimes = chimes_dry * 0.8 + chimes_reverb * 0.2
         mixed = (all_chimes * 0.15) + (wind_sound * 0.3)
         
         # Final compression and limiting with gentler settings
@@ -132,135 +240,113 @@ class FMWindChimeAmbience:
         # Gentle EQ - slight high frequency reduction
         final_output = sf.SVFilter(compressed, "low_pass", cutoff=10000, resonance=0.1)
         
-        # Create recording buffer
+        # Create the looping segment buffer and the on-disk recording it is flushed to
         sample_rate = self.graph.sample_rate
         buffer_seconds = duration_minutes * 60
-        buffer = sf.Buffer(2, int(sample_rate * buffer_seconds))
+        total_frames = int(sample_rate * buffer_seconds)
+        segment = sf.Buffer(2, int(sample_rate * RECORD_SEGMENT_SECONDS))
+        recording = np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode='w+', shape=(total_frames, 2))
         
         # Record and play
-        recorder = sf.BufferRecorder(buffer, final_output)
+        recorder = sf.BufferRecorder(segment, final_output, loop=True)
         recorder.play()
         final_output.play()
         
         # Wind also plays separately
         wind_sound.play()
         
-        # Chime triggering thread
-        def trigger_chimes():
-            while self.running:
-                # Wind strength affects chime frequency
-                current_time = time.time()
-                
-                # Base wind strength (0-1)
-                base_wind = 0.3 + 0.7 * (0.5 + 0.5 * np.sin(current_time * 0.02))
+        # Render the graph block by block up to a point in the piece (in seconds),
+        # taking bells out of the mix again once they have rung out and flushing
+        # the segment buffer (tracking the peak while it is in cache) as it fills
+        block_size = self.graph.output_buffer_size
+        segment_frames = segment.num_frames
+        ring_frames = int(BELL_RING_TIME * sample_rate)
+        release_frames = {}  # chime index -> frame at which it leaves the mix
+        rendered_frames = 0
+        max_val = 0.0
+        
+        def render_until(seconds):
+            nonlocal rendered_frames, max_val
+            target_frames = min(int(seconds * sample_rate), total_frames)
+            
+            # Snap a target within a few frames of the current position or of a
+            # segment boundary onto it, so no stretch between stops is a sliver
+            segment_start = target_frames - target_frames % segment_frames
+            for stop in (rendered_frames, segment_start, min(segment_start + segment_frames, total_frames)):
+                if abs(target_frames - stop) < MIN_RENDER_FRAMES:
+                    target_frames = max(stop, rendered_frames)
+                    break
+            
+            while rendered_frames < target_frames:
+                for idx, release_frame in list(release_frames.items()):
+                    if release_frame <= rendered_frames:
+                        chimes_dry.remove_input(chimes[idx]['output'])
+                        del release_frames[idx]
                 
-                # Add gusts
-                if random.random() < 0.1:  # 10% chance of gust
-                    base_wind = min(1.0, base_wind + random.uniform(0.2, 0.4))
+                segment_pos = rendered_frames % segment_frames
+                frames_to_stop = min(target_frames - rendered_frames, segment_frames - segment_pos)
+                num_frames = min(block_size, frames_to_stop)
                 
-                # Interval between chimes based on wind - increased for more space
-                base_interval = 1.5
-                interval = base_interval * (2.5 - base_wind) + random.uniform(-0.3, 0.3)
-                interval = max(0.4, interval)
+                # Split a last stretch just over a block into two even renders
+                # rather than a full block and a sliver
+                if block_size < frames_to_stop < block_size + MIN_RENDER_FRAMES:
+                    num_frames = frames_to_stop // 2
                 
-                time.sleep(interval)
+                self.graph.render(num_frames)
+                rendered_frames += num_frames
                 
-                if self.running:
-                    # Select chimes that haven't been hit recently
-                    available = []
-                    current_time = time.time()
-                    
-                    for i, chime in enumerate(chimes):
-                        if current_time - chime['last_hit'] > 1.5:  # 1.5 second cooldown for more space
-                            available.append(i)
-                    
-                    if available:
-                        # Random chance for adjacent bells to ring together
-                        selected = []
-                        first_idx = random.choice(available)
-                        selected.append(first_idx)
-                        
-                        # 30% chance for adjacent bells
-                        if random.random() < 0.3:
-                            adjacent_candidates = []
-                            for idx in available:
-                                if abs(idx - first_idx) == 1 and idx not in selected:
-                                    adjacent_candidates.append(idx)
-                            
-                            if adjacent_candidates:
-                                # Can select 1-2 adjacent bells
-                                num_adjacent = random.randint(1, min(2, len(adjacent_candidates)))
-                                selected.extend(random.sample(adjacent_candidates, num_adjacent))
-                        
-                        # Small chance for distant harmony
-                        elif random.random() < 0.15:
-                            # Look for harmonic intervals (3rd, 5th)
-                            harmony_candidates = []
-                            for idx in available:
-                                interval = abs(idx - first_idx)
-                                if interval in [2, 4] and idx not in selected:  # 3rd or 5th in scale
-                                    harmony_candidates.append(idx)
-                            
-                            if harmony_candidates:
-                                selected.append(random.choice(harmony_candidates))
-                        
-                        # Trigger selected chimes
-                        for i, idx in enumerate(selected):
-                            chime = chimes[idx]
-                            
-                            # Velocity based on wind with wider range for more variance
-                            velocity = 0.15 + (base_wind * 0.5) + random.uniform(-0.1, 0.15)
-                            velocity = max(0.1, min(0.8, velocity))
-                            
-                            # Trigger with slight delay for rolling effect
-                            if i > 0:
-                                time.sleep(random.uniform(0.02, 0.08))
-                            
-                            # Enable the bell and trigger envelopes
-                            chime['master_gate'].set_value(1)
-                            chime['mod_env'].trigger()
-                            chime['carrier_env'].trigger()
-                            chime['last_hit'] = time.time()
-        
-        # Start composition
-        self.running = True
-        
-        # Start without any initial chime - let the wind build naturally
-        
-        # Start chime triggering thread
-        chime_thread = threading.Thread(target=trigger_chimes)
-        chime_thread.daemon = True
-        chime_thread.start()
-        
-        # Let composition play
-        time.sleep(duration_minutes * 60)
-        
-        # Stop and export
-        self.running = False
+                filled = segment_pos + num_frames
+                if filled == segment_frames or rendered_frames == total_frames:
+                    segment_data = segment.data[:, :filled]
+                    max_val = max(max_val, segment_data.max(), -segment_data.min())
+                    recording[rendered_frames - filled:rendered_frames] = segment_data.T
+        
+        # Start without any initial chime - let the wind build naturally.
+        # Render up to each strike, then the rest of the composition
+        rng = np.random.default_rng()
+        add_bell = chimes_dry.add_input
+        for strike_time, idx in self.schedule_chimes(len(chimes), buffer_seconds, rng):
+            render_until(strike_time)
+            
+            # Connect the bell (unless still ringing) and trigger envelopes
+            chime = chimes[idx]
+            if idx not in release_frames:
+                add_bell(chime['output'])
+            trigger_mod, trigger_carrier = chime['trigger_fns']
+            trigger_mod()
+            trigger_carrier()
+            release_frames[idx] = rendered_frames + ring_frames
+        render_until(buffer_seconds)
+        recorder.stop()
         
         print("Exporting audio to WAV file...")
-        audio_data = buffer.data.T
+        audio_data = recording
         
-        # Normalize
-        max_val = np.max(np.abs(audio_data))
-        if max_val > 0:
-            audio_data = audio_data / max_val * 0.9
+        # Normalize with 0.9 headroom
+        gain = 0.9 / max_val if max_val > 0 else 0.0
         
-        # Apply fade in/out
-        fade_samples = int(sample_rate * 2)  # 2 second fades
-        # Fade in
-        for i in range(fade_samples):
-            audio_data[i] *= i / fade_samples
-        # Fade out
-        for i in range(fade_samples):
-            audio_data[-(i+1)] *= i / fade_samples
-        
-        # Convert to 16-bit
-        audio_data = np.int16(audio_data * 32767)
-        
-        # Save
+        # Stream to a 16-bit WAV file, normalizing and fading each chunk on the
+        # way out into one reused scratch block - libsndfile does the int16
+        # conversion as it writes
         filename = f"fm_windchime_ambient_{duration_minutes}min.wav"
-        wavfile.write(filename, sample_rate, audio_data)
+        num_frames = len(audio_data)
+        fade_samples = int(sample_rate * 2)  # 2 second fades
+        chunk_frames = 65536
+        chunk = np.empty((chunk_frames, 2), dtype=audio_data.dtype)
+        with soundfile.SoundFile(filename, 'w', sample_rate, 2, subtype='PCM_16') as wav_file:
+            for start in range(0, num_frames, chunk_frames):
+                end = min(start + chunk_frames, num_frames)
+                out = chunk[:end - start]
+                if start < fade_samples or end > num_frames - fade_samples:
+                    # Fade in/out ramps with the normalization gain folded in
+                    # (on pieces under 4 seconds the two fades overlap)
+                    frames = np.arange(start, end)
+                    fade_gain = (np.minimum(frames / fade_samples, 1.0) *
+                                 np.minimum((num_frames - 1 - frames) / fade_samples, 1.0) * gain)
+                    np.multiply(audio_data[start:end], fade_gain.astype(out.dtype)[:, np.newaxis], out=out)
+                else:
+                    np.multiply(audio_data[start:end], gain, out=out)
+                wav_file.write(out)
         print(f"Audio exported to: {filename}")
         
         # Clean up
@@ -285,7 +371,6 @@ def main():
         windchimes.start_composition(duration_minutes=3)
     except KeyboardInterrupt:
         print("\nStopping composition...")
-        windchimes.running = False
         windchimes.graph.stop()
         windchimes.graph.destroy()
 